@@ -5,14 +5,27 @@ Downloads markdowns from S3, truncates, combines with prompt.
 """
 
 import gzip
-import json
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
 
 import boto3
+import orjson
 import pandas as pd
+import tiktoken
 import yaml
+from botocore.config import Config
 from tqdm import tqdm
 
+# Markdown downloads are I/O-bound, so fan them out over threads sharing one client.
+# The connection pool is sized above the worker count so threads never wait on a socket.
+DOWNLOAD_WORKERS = 32
+S3_CONFIG = Config(
+    max_pool_connections=64,
+    retries={'max_attempts': 10, 'mode': 'adaptive'}
+)
+
 
 def load_config():
     with open("config.yaml") as f:
@@ -25,34 +38,63 @@ def load_prompt(prompt_path='prompts/extract_guarded.txt'):
         return f.read()
 
 
-def truncate_markdown(content, max_tokens=2000):
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    """Tokenizer for the target model (o200k_base if tiktoken doesn't know it)."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+
+def truncate_markdown(content, max_tokens=2000, model='gpt-4o-mini', partial=False):
     """
-    Truncate markdown to approximately max_tokens.
-    Simple word-based approximation (1 token ≈ 0.75 words).
+    Truncate markdown to at most max_tokens, counted with the model's tokenizer.
+    Content short enough to fit (~4 chars per token) is returned untouched
+    without being tokenized.
+    partial=True means content is already a cut-off prefix (ranged download),
+    so it is always marked as truncated.
     """
-    words = content.split()
-    max_words = int(max_tokens * 0.75)
+    marker = "\n\n[... content truncated ...]"
     
-    if len(words) <= max_words:
+    if not partial and len(content) <= max_tokens * 4:
         return content
     
-    # Keep first max_words
-    truncated = ' '.join(words[:max_words])
-    truncated += "\n\n[... content truncated ...]"
+    encoding = get_encoding(model)
+    tokens = encoding.encode(content, disallowed_special=())
+    
+    if len(tokens) <= max_tokens:
+        return content + marker if partial else content
+    
+    # Keep first max_tokens
+    truncated = encoding.decode(tokens[:max_tokens])
+    truncated += marker
     
     return truncated
 
 
-def download_markdown(s3_key, bucket, region):
-    """Download markdown content from S3."""
+def download_markdown(s3, s3_key, bucket, size_bytes=None, max_bytes=None):
+    """
+    Download markdown content from S3 (client is shared across threads).
+    Objects larger than max_bytes are fetched with a Range request, since
+    anything past that point would be truncated away anyway.
+    
+    Returns (content, partial), where partial is True for a ranged prefix,
+    or (None, False) on failure.
+    """
     try:
-        s3 = boto3.client('s3', region_name=region)
-        response = s3.get_object(Bucket=bucket, Key=s3_key)
-        content = response['Body'].read().decode('utf-8')
-        return content
+        if max_bytes and size_bytes and size_bytes > max_bytes:
+            response = s3.get_object(Bucket=bucket, Key=s3_key, Range=f'bytes=0-{max_bytes - 1}')
+            # The range may end mid-character
+            content = response['Body'].read().decode('utf-8', errors='ignore')
+            return content, True
+        else:
+            response = s3.get_object(Bucket=bucket, Key=s3_key)
+            content = response['Body'].read().decode('utf-8')
+            return content, False
     except Exception as e:
         print(f"[ERROR] Failed to download {s3_key}: {e}")
-        return None
+        return None, False
 
 
 def create_batch_request(custom_id, prompt, markdown_content, config):
@@ -100,26 +142,47 @@ def build_requests(config, todo_df, prompt):
     bucket = config['aws']['bucket']
     region = config['aws']['region']
     max_input_tokens = config['batch']['max_input_tokens']
+    model = config['openai']['model']
+    
+    # Safe upper bound on bytes needed to fill max_input_tokens (~4 chars/token + 20%)
+    max_bytes = int(max_input_tokens * 4 * 1.2)
+    
+    s3 = boto3.client('s3', region_name=region, config=S3_CONFIG)
     
     requests = []
     failed = []
     
     print(f"[INFO] Building requests for {len(todo_df)} sites...")
     
-    for idx, row in tqdm(todo_df.iterrows(), total=len(todo_df)):
-        custom_id = row['custom_id']
-        s3_key = row['s3_key']
+    # Download markdowns in parallel, keyed by custom_id
+    markdowns = {}
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        futures = {
+            executor.submit(download_markdown, s3, s3_key, bucket, size_bytes, max_bytes): custom_id
+            for custom_id, s3_key, size_bytes in zip(
+                todo_df['custom_id'].to_numpy(),
+                todo_df['s3_key'].to_numpy(),
+                todo_df['size_bytes'].to_numpy()
+            )
+        }
         
-        # Download markdown
-        markdown = download_markdown(s3_key, bucket, region)
+        for future in tqdm(as_completed(futures), total=len(futures), disable=not sys.stderr.isatty(), mininterval=0.5):
+            markdown, partial = future.result()
+            
+            # Truncate if needed (a ranged prefix is cut even if it fits)
+            if markdown:
+                markdown = truncate_markdown(markdown, max_input_tokens, model, partial)
+            
+            markdowns[futures[future]] = markdown
+    
+    # Assemble requests in todo order so batch files stay deterministic
+    for custom_id in todo_df['custom_id']:
+        markdown = markdowns.pop(custom_id, None)
         
         if not markdown:
             failed.append(custom_id)
             continue
         
-        # Truncate if needed
-        markdown = truncate_markdown(markdown, max_input_tokens)
-        
         # Create request
         request = create_batch_request(custom_id, prompt, markdown, config)
         requests.append(request)
@@ -152,18 +215,17 @@ def write_batches(requests, batch_size, config):
         filename = f"batch_{batch_num:04d}.jsonl"
         filepath = output_dir / filename
         
-        # Write plain JSONL
-        with open(filepath, 'w', encoding='utf-8') as f:
-            for req in batch:
-                f.write(json.dumps(req) + '\n')
+        # Write plain JSONL as a single payload (one write per file, not per line)
+        payload = b'\n'.join(orjson.dumps(req) for req in batch) + b'\n'
+        filepath.write_bytes(payload)
         
         batch_files.append({
             'filename': filename,
             'count': len(batch),
-            'size_bytes': filepath.stat().st_size
+            'size_bytes': len(payload)
         })
         
-        print(f"[INFO] Wrote {filename}: {len(batch)} requests, {filepath.stat().st_size / 1024:.1f} KB")
+        print(f"[INFO] Wrote {filename}: {len(batch)} requests, {len(payload) / 1024:.1f} KB")
     
     return batch_files
 
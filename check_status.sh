@@ -21,7 +21,7 @@ echo "📁 Files created:"
 [ -f "test/inputs/site_index.csv" ] && echo "  ✓ Site index ($(wc -l < test/inputs/site_index.csv) sites)" || echo "  ✗ Site index"
 [ -f "test/inputs/todo.csv" ] && echo "  ✓ Todo list ($(wc -l < test/inputs/todo.csv) sites)" || echo "  ✗ Todo list"
 [ -d "test/requests" ] && echo "  ✓ Batch requests ($(ls test/requests/*.jsonl.gz 2>/dev/null | wc -l) files)" || echo "  ✗ Batch requests"
-[ -f "test/manifests/batch_jobs.csv" ] && echo "  ✓ Batch jobs ($(tail -n +2 test/manifests/batch_jobs.csv 2>/dev/null | wc -l) jobs)" || echo "  ✗ Batch jobs"
+[ -f "test/manifests/batch_jobs.parquet" ] && echo "  ✓ Batch jobs ($(python3 -c "from poll_core import load_manifest; print(len(load_manifest({'paths': {'manifests': 'test/manifests'}})))" 2>/dev/null) jobs)" || echo "  ✗ Batch jobs"
 [ -d "test/responses" ] && echo "  ✓ Responses ($(ls test/responses/*.jsonl.gz 2>/dev/null | wc -l) files)" || echo "  ✗ Responses"
 [ -f "test/tables/business_intelligence.csv" ] && echo "  ✓ Business intelligence ($(tail -n +2 test/tables/business_intelligence.csv 2>/dev/null | wc -l) sites)" || echo "  ✗ Business intelligence"
 [ -f "test/tables/website_quality_status.csv" ] && echo "  ✓ Quality status ($(tail -n +2 test/tables/website_quality_status.csv 2>/dev/null | wc -l) sites)" || echo "  ✗ Quality status"
@@ -29,13 +29,14 @@ echo "📁 Files created:"
 echo ""
 
 # Check OpenAI batch status if manifest exists
-if [ -f "test/manifests/batch_jobs.csv" ]; then
+if [ -f "test/manifests/batch_jobs.parquet" ]; then
     echo "🤖 OpenAI Batch Jobs:"
     echo ""
     python3 -c "
-import pandas as pd
+from poll_core import load_manifest
 try:
-    df = pd.read_csv('test/manifests/batch_jobs.csv')
+    # Snapshot plus the update log, so counts are current while polling runs
+    df = load_manifest({'paths': {'manifests': 'test/manifests'}})
     if not df.empty:
         status_counts = df['status'].value_counts()
         for status, count in status_counts.items():
@@ -4,14 +4,22 @@ Discover all big_markdown.md files in S3 and create site_index.csv.
 """
 
 import argparse
-import csv
 import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import boto3
+import pandas as pd
 import yaml
+from botocore.config import Config
 from tqdm import tqdm
 
+# Each deal directory under the crawled prefix is listed by its own paginator
+LIST_WORKERS = 16
+
+_DEAL_RE = re.compile(r'deal_(\d+)_(.+)')
+
 
 def load_config():
     with open("config.yaml") as f:
@@ -23,16 +31,17 @@ def parse_s3_path(s3_key):
     Extract deal_id, domain, timestamp from S3 key.
     Format: crawler-6k-results/processed/deal_X_domain/timestamp/big_markdown.md
     """
-    parts = s3_key.split("/")
+    # Bounded split from the right: [prefix, deal_domain, timestamp, filename]
+    parts = s3_key.rsplit("/", 3)
     
-    if len(parts) < 5:
+    if len(parts) < 4:
         return None, None, None
     
-    deal_domain = parts[2]  # e.g., "deal_105_www.amutecsrl.com"
-    timestamp = parts[3]     # e.g., "20251105_141718"
+    deal_domain = parts[1]  # e.g., "deal_105_www.amutecsrl.com"
+    timestamp = parts[2]     # e.g., "20251105_141718"
     
     # Extract deal_id and domain
-    match = re.match(r'deal_(\d+)_(.+)', deal_domain)
+    match = _DEAL_RE.match(deal_domain)
     if match:
         deal_id = match.group(1)
         domain = match.group(2)
@@ -41,26 +50,15 @@ def parse_s3_path(s3_key):
     return None, None, None
 
 
-def discover_sites(config, limit=None):
+def list_markdowns(s3, bucket, prefix, limit=None):
     """
-    List all big_markdown.md files from S3 and extract metadata.
-    
-    Returns:
-        List of dicts with: custom_id, deal_id, domain, url, s3_key, timestamp, size_bytes
+    List big_markdown.md files under a single prefix and extract metadata.
+    Stops early once limit sites have been found.
     """
-    bucket = config['aws']['bucket']
-    prefix = config['aws']['s3_prefix_crawled']
-    region = config['aws']['region']
-    
-    s3 = boto3.client('s3', region_name=region)
-    
-    print(f"[INFO] Listing files from s3://{bucket}/{prefix}")
-    
     paginator = s3.get_paginator('list_objects_v2')
     pages = paginator.paginate(Bucket=bucket, Prefix=prefix)
     
     sites = []
-    count = 0
     
     for page in pages:
         if 'Contents' not in page:
@@ -95,12 +93,56 @@ def discover_sites(config, limit=None):
                 'size_bytes': obj['Size']
             })
             
-            count += 1
-            if limit and count >= limit:
-                break
-        
-        if limit and count >= limit:
-            break
+            if limit and len(sites) >= limit:
+                return sites
+    
+    return sites
+
+
+def list_subprefixes(s3, bucket, prefix):
+    """List the immediate sub-prefixes (one per deal_X_domain directory)."""
+    paginator = s3.get_paginator('list_objects_v2')
+    pages = paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter='/')
+    
+    subprefixes = []
+    for page in pages:
+        subprefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
+    
+    return subprefixes
+
+
+def discover_sites(config, limit=None):
+    """
+    List all big_markdown.md files from S3 and extract metadata.
+    Sub-prefixes are listed in parallel; a limited run walks the prefix serially
+    so it can stop after the first few keys.
+    
+    Returns:
+        List of dicts with: custom_id, deal_id, domain, url, s3_key, timestamp, size_bytes
+    """
+    bucket = config['aws']['bucket']
+    prefix = config['aws']['s3_prefix_crawled']
+    region = config['aws']['region']
+    
+    s3 = boto3.client('s3', region_name=region, config=Config(max_pool_connections=LIST_WORKERS))
+    
+    print(f"[INFO] Listing files from s3://{bucket}/{prefix}")
+    
+    if limit:
+        return list_markdowns(s3, bucket, prefix, limit=limit)
+    
+    subprefixes = list_subprefixes(s3, bucket, prefix.rstrip('/') + '/')
+    
+    if not subprefixes:
+        return list_markdowns(s3, bucket, prefix)
+    
+    print(f"[INFO] Listing {len(subprefixes)} sub-prefixes with {LIST_WORKERS} workers")
+    
+    # executor.map preserves sub-prefix order, so output matches a serial listing
+    with ThreadPoolExecutor(max_workers=LIST_WORKERS) as executor:
+        results = executor.map(lambda p: list_markdowns(s3, bucket, p), subprefixes)
+        progress = tqdm(results, total=len(subprefixes), disable=not sys.stderr.isatty(), mininterval=0.5)
+        sites = [site for shard in progress for site in shard]
     
     return sites
 
@@ -110,11 +152,8 @@ def write_site_index(sites, output_path):
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    with open(output_path, 'w', newline='', encoding='utf-8') as f:
-        fieldnames = ['custom_id', 'deal_id', 'domain', 'url', 's3_key', 'timestamp', 'size_bytes']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(sites)
+    fieldnames = ['custom_id', 'deal_id', 'domain', 'url', 's3_key', 'timestamp', 'size_bytes']
+    pd.DataFrame(sites, columns=fieldnames).to_csv(output_path, index=False, encoding='utf-8')
     
     print(f"[DONE] Wrote {len(sites)} sites to {output_path}")
 
@@ -5,16 +5,58 @@ Also uploads per-site JSON extractions to S3.
 """
 
 import gzip
+import io
 import json
+import os
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
 
 import boto3
+import orjson
 import pandas as pd
 import yaml
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from tqdm import tqdm
 
+# Per-site JSON uploads are small PUTs, so latency dominates; run them concurrently
+# over one shared client whose pool is large enough for every worker.
+UPLOAD_WORKERS = 50
+S3_CONFIG = Config(
+    max_pool_connections=64,
+    retries={'max_attempts': 10, 'mode': 'adaptive'}
+)
+
+# Table uploads go through s3transfer; large tables switch to parallel multipart parts
+TABLE_TRANSFER_CONFIG = TransferConfig(
+    max_concurrency=UPLOAD_WORKERS,
+    multipart_threshold=8 * 1024 * 1024
+)
+
+# Extraction output patterns, compiled once
+_STATUS_RE = re.compile(r'scrape_status:\s*(success|error)', re.IGNORECASE)
+_ERROR_CODE_RE = re.compile(r'error_code:\s*(\w+|null)', re.IGNORECASE)
+# Labels only; each value is matched separately from the end of its label,
+# so a value can never consume a following label
+_FIELD_LABEL_RE = re.compile(
+    r'(?P<key>sectorial niche/s|end markets|product offerings|service offerings|core activities):',
+    re.IGNORECASE
+)
+_FIELD_VALUE_RE = re.compile(r'\s*([^\n]+)')
+_SPLIT_RE = re.compile(r'[,;]')
+
+# Schema label (lowercased) -> result field
+_FIELD_NAMES = {
+    'sectorial niche/s': 'sectorial_niches',
+    'end markets': 'end_markets',
+    'product offerings': 'product_offerings',
+    'service offerings': 'service_offerings',
+    'core activities': 'core_activities'
+}
+
 
 def load_config():
     with open("config.yaml") as f:
@@ -44,36 +86,39 @@ def parse_extraction_output(text):
         'core_activities': []
     }
     
-    # Extract status header
-    status_match = re.search(r'scrape_status:\s*(success|error)', text, re.IGNORECASE)
-    if status_match:
-        result['scrape_status'] = status_match.group(1).lower()
-    
-    error_match = re.search(r'error_code:\s*(\w+|null)', text, re.IGNORECASE)
-    if error_match:
-        error_code = error_match.group(1)
-        result['error_code'] = None if error_code.lower() == 'null' else error_code
-    
-    # If error, return early
-    if result['scrape_status'] == 'error':
-        return result
-    
-    # Extract fields
-    field_patterns = {
-        'sectorial_niches': r'sectorial niche/s:\s*([^\n]+)',
-        'end_markets': r'end markets:\s*([^\n]+)',
-        'product_offerings': r'product offerings:\s*([^\n]+)',
-        'service_offerings': r'service offerings:\s*([^\n]+)',
-        'core_activities': r'core activities:\s*([^\n]+)'
-    }
-    
-    for field, pattern in field_patterns.items():
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            values_str = match.group(1).strip()
-            # Split by comma or semicolon
-            values = [v.strip().strip('"').strip("'") for v in re.split(r'[,;]', values_str) if v.strip()]
-            result[field] = values
+    # Extract status header. It leads the output when present; if it's missing,
+    # skip the header scans and let the extracted fields decide the status below.
+    if 'scrape_status' in text[:200].lower():
+        status_match = _STATUS_RE.search(text)
+        if status_match:
+            result['scrape_status'] = status_match.group(1).lower()
+        
+        error_match = _ERROR_CODE_RE.search(text)
+        if error_match:
+            error_code = error_match.group(1)
+            result['error_code'] = None if error_code.lower() == 'null' else error_code
+        
+        # If error, return early
+        if result['scrape_status'] == 'error':
+            return result
+    
+    # Extract fields in a single pass over the labels (first occurrence of each
+    # label with a value wins)
+    seen = set()
+    for match in _FIELD_LABEL_RE.finditer(text):
+        field = _FIELD_NAMES[match.group('key').lower()]
+        if field in seen:
+            continue
+        
+        value_match = _FIELD_VALUE_RE.match(text, match.end())
+        if not value_match:
+            continue
+        seen.add(field)
+        
+        values_str = value_match.group(1).strip()
+        # Split by comma or semicolon
+        values = [v.strip().strip('"').strip("'") for v in _SPLIT_RE.split(values_str) if v.strip()]
+        result[field] = values
     
     # If we got data, mark as success
     if any(result[field] for field in ['sectorial_niches', 'product_offerings', 'service_offerings', 'core_activities']):
@@ -92,11 +137,11 @@ def process_response_file(filepath):
     results = []
     errors = []
     
-    # Handle both .gz and plain .jsonl
+    # Handle both .gz and plain .jsonl (read as bytes, orjson parses UTF-8 directly)
     if filepath.suffix == '.gz':
-        f = gzip.open(filepath, 'rt', encoding='utf-8')
+        f = gzip.open(filepath, 'rb')
     else:
-        f = open(filepath, 'r', encoding='utf-8')
+        f = open(filepath, 'rb')
     
     try:
         for line in f:
@@ -104,7 +149,7 @@ def process_response_file(filepath):
                 continue
             
             try:
-                response = json.loads(line)
+                response = orjson.loads(line)
                 
                 custom_id = response.get('custom_id')
                 
@@ -141,7 +186,7 @@ def process_response_file(filepath):
                 
                 results.append(extraction)
             
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 print(f"[WARN] Failed to parse line: {e}")
                 continue
     
@@ -167,13 +212,19 @@ def merge_all_responses(config):
     all_results = []
     all_errors = []
     
-    for filepath in tqdm(response_files):
-        results, errors = process_response_file(filepath)
-        all_results.extend(results)
-        all_errors.extend(errors)
+    # Files are independent and parsing is CPU-bound, so spread them across processes
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        parsed = executor.map(process_response_file, response_files, chunksize=1)
         
-        if errors:
-            print(f"[WARN] {filepath.name}: {len(errors)} errors")
+        progress = tqdm(zip(response_files, parsed), total=len(response_files),
+                        disable=not sys.stderr.isatty(), mininterval=0.5)
+        
+        for filepath, (results, errors) in progress:
+            all_results.extend(results)
+            all_errors.extend(errors)
+            
+            if errors:
+                print(f"[WARN] {filepath.name}: {len(errors)} errors")
     
     # Convert to dataframes
     results_df = pd.DataFrame(all_results)
@@ -182,7 +233,7 @@ def merge_all_responses(config):
     return results_df, errors_df
 
 
-def upload_per_site_json(custom_id, extraction, config):
+def upload_per_site_json(s3, custom_id, extraction, timestamp_by_id, config):
     """
     Upload extraction JSON to S3 in the answers/ folder.
     Path: s3://bucket/answers/deal_X_domain/timestamp/extraction.json
@@ -196,19 +247,14 @@ def upload_per_site_json(custom_id, extraction, config):
         deal_id = match.group(1)
         domain = match.group(2)
         
-        # Load site_index to get timestamp
-        site_index_path = f"{config['paths']['inputs']}site_index.csv"
-        site_index = pd.read_csv(site_index_path)
-        site_row = site_index[site_index['custom_id'] == custom_id]
+        # Timestamp comes from the site_index lookup built once by the caller
+        timestamp = timestamp_by_id.get(custom_id)
         
-        if site_row.empty:
+        if timestamp is None:
             return False
         
-        timestamp = site_row.iloc[0]['timestamp']
-        
         # Construct S3 path
         bucket = config['aws']['bucket']
-        region = config['aws']['region']
         prefix = config['aws']['s3_prefix_answers']
         
         s3_key = f"{prefix}/deal_{deal_id}_{domain}/{timestamp}/extraction.json"
@@ -223,12 +269,11 @@ def upload_per_site_json(custom_id, extraction, config):
             **{k: v for k, v in extraction.items() if k != 'custom_id' and k != 'raw_output'}
         }
         
-        # Upload
-        s3 = boto3.client('s3', region_name=region)
+        # Upload (compact JSON, serialized once)
         s3.put_object(
             Bucket=bucket,
             Key=s3_key,
-            Body=json.dumps(extraction_json, indent=2),
+            Body=json.dumps(extraction_json).encode('utf-8'),
             ContentType='application/json'
         )
         
@@ -239,6 +284,27 @@ def upload_per_site_json(custom_id, extraction, config):
         return False
 
 
+def upload_all_site_jsons(s3, results_df, timestamp_by_id, config):
+    """
+    Upload per-site extraction JSONs concurrently over a shared S3 client.
+    timestamp_by_id maps custom_id -> crawl timestamp (from site_index).
+    
+    Returns number of successful uploads.
+    """
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = [
+            executor.submit(upload_per_site_json, s3, extraction['custom_id'], extraction, timestamp_by_id, config)
+            for extraction in results_df.to_dict('records')
+        ]
+        
+        uploaded = 0
+        for future in tqdm(as_completed(futures), total=len(futures), disable=not sys.stderr.isatty(), mininterval=0.5):
+            if future.result():
+                uploaded += 1
+    
+    return uploaded
+
+
 def main():
     import argparse
     parser = argparse.ArgumentParser(description="Merge batch responses")
@@ -280,7 +346,7 @@ def main():
     # Convert lists to pipe-separated strings for CSV
     list_cols = ['sectorial_niches', 'end_markets', 'product_offerings', 'service_offerings', 'core_activities']
     for col in list_cols:
-        bi_df[col] = bi_df[col].apply(lambda x: ' | '.join(x) if isinstance(x, list) else '')
+        bi_df[col] = [' | '.join(x) if isinstance(x, list) else '' for x in bi_df[col].to_numpy()]
     
     # Write outputs
     tables_dir = Path(config['paths']['tables'])
@@ -290,6 +356,11 @@ def main():
     bi_df.to_csv(bi_path, index=False)
     print(f"[DONE] Wrote {bi_path}: {len(bi_df)} rows")
     
+    # Columnar copy for downstream readers (plan_delta reads just custom_id from it)
+    bi_parquet_path = tables_dir / 'business_intelligence.parquet'
+    bi_df.to_parquet(bi_parquet_path, engine='pyarrow', compression='snappy', index=False)
+    print(f"[DONE] Wrote {bi_parquet_path}: {len(bi_df)} rows")
+    
     # Create quality status table
     quality_df = results_df[['custom_id', 'deal_id', 'domain', 'url', 'scrape_status', 'error_code']].copy()
     quality_path = tables_dir / 'website_quality_status.csv'
@@ -308,18 +379,16 @@ def main():
     else:
         print(f"\n[INFO] Uploading {len(results_df)} per-site JSONs to S3...")
         
-        uploaded = 0
-        for idx, row in tqdm(results_df.iterrows(), total=len(results_df)):
-            extraction = row.to_dict()
-            if upload_per_site_json(row['custom_id'], extraction, config):
-                uploaded += 1
+        # One client for every upload below (low-level clients are thread-safe)
+        s3 = boto3.client('s3', region_name=config['aws']['region'], config=S3_CONFIG)
         
+        # O(1) timestamp lookup per row, built from the site_index already loaded above
+        timestamp_by_id = dict(zip(site_index['custom_id'], site_index['timestamp']))
+        uploaded = upload_all_site_jsons(s3, results_df, timestamp_by_id, config)
         print(f"[DONE] Uploaded {uploaded}/{len(results_df)} JSONs to S3")
         
         # Upload CSV tables to S3
         print(f"\n[INFO] Uploading CSV tables to S3...")
-        import boto3
-        s3 = boto3.client('s3', region_name=config['aws']['region'])
         bucket = config['aws']['bucket']
         s3_prefix = config['aws']['s3_prefix_tables']
         
@@ -331,9 +400,16 @@ def main():
         if not errors_df.empty:
             csv_files.append((error_path, f"{s3_prefix}/dead_letter.csv"))
         
+        # Tables are gzipped in transit only (local copies stay plain for plan_delta/validate);
+        # S3 serves them back with Content-Encoding: gzip
         for local_path, s3_key in csv_files:
             try:
-                s3.upload_file(str(local_path), bucket, s3_key)
+                body = gzip.compress(local_path.read_bytes(), compresslevel=1)
+                s3.upload_fileobj(
+                    io.BytesIO(body), bucket, s3_key,
+                    ExtraArgs={'ContentType': 'text/csv', 'ContentEncoding': 'gzip'},
+                    Config=TABLE_TRANSFER_CONFIG
+                )
                 print(f"  ✓ Uploaded {local_path.name} to s3://{bucket}/{s3_key}")
             except Exception as e:
                 print(f"  ✗ Failed to upload {local_path.name}: {e}")
@@ -350,6 +426,7 @@ def main():
     print(f"API errors: {len(errors_df)}")
     print(f"\nOutput files:")
     print(f"  - Local: tables/business_intelligence.csv")
+    print(f"  - Local: tables/business_intelligence.parquet")
     print(f"  - Local: tables/website_quality_status.csv")
     if not args.skip_s3:
         print(f"  - S3 Tables: s3://{config['aws']['bucket']}/{config['aws']['s3_prefix_tables']}/")
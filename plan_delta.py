@@ -27,13 +27,20 @@ def load_site_index(config):
 
 
 def load_existing_results(config):
-    """Load existing processed sites (if any)."""
+    """
+    Load existing processed sites (if any).
+    Prefers the Parquet table, reading only the custom_id column; falls back to CSV.
+    """
+    parquet_path = f"{config['paths']['tables']}business_intelligence.parquet"
+    if Path(parquet_path).exists():
+        return pd.read_parquet(parquet_path, columns=['custom_id'])
+    
     path = f"{config['paths']['tables']}business_intelligence.csv"
     if not Path(path).exists():
         print(f"[INFO] No existing results found at {path}")
         return pd.DataFrame()
     
-    return pd.read_csv(path)
+    return pd.read_csv(path, usecols=['custom_id'])
 
 
 def compute_delta(site_index, existing_results):
@@ -43,10 +50,14 @@ def compute_delta(site_index, existing_results):
         return site_index
     
     # Find custom_ids already processed
-    processed_ids = set(existing_results['custom_id'].unique())
+    processed_ids = existing_results['custom_id'].unique()
     
-    # Filter to unprocessed only
-    todo = site_index[~site_index['custom_id'].isin(processed_ids)]
+    # Drop them by index label (no full-length boolean mask over site_index)
+    todo = (
+        site_index.set_index('custom_id')
+        .drop(index=processed_ids, errors='ignore')
+        .reset_index()
+    )
     
     return todo
 
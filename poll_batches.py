@@ -5,55 +5,110 @@ Downloads completed batch results.
 """
 
 import argparse
-import json
-import time
+import asyncio
+import multiprocessing
+import re
+import sys
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
-from openai import OpenAI
+import msgspec
 from tqdm import tqdm
 
+from poll_core import (
+    append_manifest_updates,
+    apply_manifest_updates,
+    check_batch_status,
+    create_async_client,
+    download_batch_output,
+    list_batches,
+    load_config,
+    load_manifest,
+    save_manifest,
+)
+
+# Status checks and downloads are one HTTPS round-trip each; at most this many in flight
+POLL_CONCURRENCY = 32
+
+# Fewer stale response files than this are parsed in-process; a worker pool
+# only pays off for larger backlogs (e.g. the first summary after a restart)
+PARSE_POOL_MIN_FILES = 8
+
+# Rest of the error_code header line (stripped by the caller)
+_ERROR_CODE_RE = re.compile(r'error_code:([^\n]*)')
+
+
+# Only the path response.body.choices[].message.content is declared; the decoder
+# skips every other field (usage, ids, ...) without building Python objects for it
+class _Message(msgspec.Struct):
+    content: str
+
+
+class _Choice(msgspec.Struct):
+    message: _Message
 
-def check_batch_status(client, batch_id):
-    """
-    Check status of a batch.
-    
-    Returns batch object.
-    """
-    try:
-        batch = client.batches.retrieve(batch_id)
-        return batch
-    except Exception as e:
-        print(f"[ERROR] Failed to check batch {batch_id}: {e}")
-        return None
 
+class _Body(msgspec.Struct):
+    choices: list[_Choice]
 
-def download_batch_output(client, output_file_id, output_path):
+
+class _Response(msgspec.Struct):
+    body: _Body
+
+
+class _ResponseLine(msgspec.Struct):
+    response: _Response
+
+
+_RESPONSE_DECODER = msgspec.json.Decoder(_ResponseLine)
+
+# Per-file analysis results: path -> ((mtime_ns, size), success, error, Counter)
+# Response files are written once, so most are reused across progress summaries
+_FILE_STATS_CACHE = {}
+
+# Running totals over _FILE_STATS_CACHE, adjusted only for files that changed
+_PROGRESS_TOTALS = {'success': 0, 'error': 0, 'error_codes': Counter()}
+
+
+def _analyze_file(response_file):
     """
-    Download batch output file.
+    Count success/error extractions in one response file.
+    Returns (success_count, error_count, Counter of error codes).
     """
+    success_count = 0
+    error_count = 0
+    error_codes = Counter()
+    
     try:
-        file_response = client.files.content(output_file_id)
-        
-        # Write to file
-        output_path = Path(output_path)
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(output_path, 'wb') as f:
-            f.write(file_response.content)
-        
-        return True
-    except Exception as e:
-        print(f"[ERROR] Failed to download output: {e}")
-        return False
+        with open(response_file, 'rb') as f:
+            for line in f:
+                try:
+                    content = _RESPONSE_DECODER.decode(line).response.body.choices[0].message.content
+                    
+                    if 'scrape_status: success' in content:
+                        success_count += 1
+                    elif 'scrape_status: error' in content:
+                        error_count += 1
+                        # Extract error code
+                        error_match = _ERROR_CODE_RE.search(content)
+                        if error_match:
+                            error_codes[error_match.group(1).strip()] += 1
+                except (msgspec.DecodeError, IndexError):
+                    continue
+    except Exception:
+        pass
+    
+    return success_count, error_count, error_codes
 
 
-def load_config():
-    import yaml
-    with open("config.yaml") as f:
-        return yaml.safe_load(f)
+def _remove_file_stats(cached):
+    """Subtract one cached file's counts from _PROGRESS_TOTALS."""
+    _, file_success, file_errors, file_codes = cached
+    _PROGRESS_TOTALS['success'] -= file_success
+    _PROGRESS_TOTALS['error'] -= file_errors
+    _PROGRESS_TOTALS['error_codes'] -= file_codes
 
 
 def analyze_progress(config, manifest_df, batch_size=1000):
@@ -74,41 +129,49 @@ def analyze_progress(config, manifest_df, batch_size=1000):
     estimated_total_sites = total_batches * batch_size
     estimated_processed_sites = completed_batches * batch_size
     
-    # Analyze downloaded responses
-    success_count = 0
-    error_count = 0
-    error_codes = []
-    
+    # Analyze downloaded responses; only new or changed files are re-parsed
+    stale = []
     for response_file in response_files:
-        try:
-            with open(response_file, 'r') as f:
-                for line in f:
-                    try:
-                        r = json.loads(line)
-                        content = r['response']['body']['choices'][0]['message']['content']
-                        
-                        if 'scrape_status: success' in content:
-                            success_count += 1
-                        elif 'scrape_status: error' in content:
-                            error_count += 1
-                            # Extract error code
-                            for content_line in content.split('\n'):
-                                if 'error_code:' in content_line:
-                                    code = content_line.split('error_code:')[1].strip()
-                                    error_codes.append(code)
-                                    break
-                    except (json.JSONDecodeError, KeyError, IndexError):
-                        continue
-        except Exception:
-            continue
+        st = response_file.stat()
+        key = (st.st_mtime_ns, st.st_size)
+        cached = _FILE_STATS_CACHE.get(response_file)
+        if cached is None or cached[0] != key:
+            stale.append((response_file, key))
+    
+    # Files that disappeared since the last summary drop out of the totals
+    gone = _FILE_STATS_CACHE.keys() - set(response_files)
+    for response_file in gone:
+        _remove_file_stats(_FILE_STATS_CACHE.pop(response_file))
+    
+    stale_paths = [path for path, _ in stale]
+    if len(stale_paths) >= PARSE_POOL_MIN_FILES:
+        # This runs in a thread beside the event loop; forking a multi-threaded
+        # process can deadlock, so workers come from a forkserver instead
+        mp_context = multiprocessing.get_context('forkserver')
+        with ProcessPoolExecutor(mp_context=mp_context) as executor:
+            parsed = list(executor.map(_analyze_file, stale_paths, chunksize=4))
+    else:
+        parsed = map(_analyze_file, stale_paths)
+    
+    for (response_file, key), file_stats in zip(stale, parsed):
+        cached = _FILE_STATS_CACHE.get(response_file)
+        if cached is not None:
+            _remove_file_stats(cached)
+        
+        file_success, file_errors, file_codes = file_stats
+        _PROGRESS_TOTALS['success'] += file_success
+        _PROGRESS_TOTALS['error'] += file_errors
+        _PROGRESS_TOTALS['error_codes'].update(file_codes)
+        _FILE_STATS_CACHE[response_file] = (key, *file_stats)
+    
+    success_count = _PROGRESS_TOTALS['success']
+    error_count = _PROGRESS_TOTALS['error']
+    error_breakdown = Counter(_PROGRESS_TOTALS['error_codes'])
     
     total_analyzed = success_count + error_count
     success_rate = (success_count / total_analyzed * 100) if total_analyzed > 0 else 0
     error_rate = (error_count / total_analyzed * 100) if total_analyzed > 0 else 0
     
-    # Error breakdown
-    error_breakdown = Counter(error_codes)
-    
     # ETA calculation (rough estimate)
     if completed_batches > 0 and pending_batches > 0:
         # Assume 5-10 minutes per batch on average
@@ -178,110 +241,165 @@ def print_progress_summary(stats):
     print(f"{'='*80}\n")
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Poll batch status and download results")
-    parser.add_argument('--interval', type=int, default=300, help='Polling interval in seconds')
-    parser.add_argument('--once', action='store_true', help='Check once and exit (no loop)')
+async def poll_batch(client, semaphore, config, listed, log_lines, batch_id, status, filename, has_response):
+    """
+    Check one batch and download its output once completed.
+    The batch object comes from this cycle's listing when available;
+    only batches missing from it are retrieved individually.
+    Status lines are appended to log_lines, which the caller writes out once.
     
-    args = parser.parse_args()
-    config = load_config()
+    Returns {column: value} changes for this batch's manifest row.
+    """
+    batch = listed.get(batch_id)
+    if batch is None:
+        async with semaphore:
+            batch = await check_batch_status(client, batch_id)
     
-    print("="*80)
-    print("POLL BATCHES")
-    print("="*80)
+    if not batch:
+        return {}
     
-    # Load manifest
-    manifest_path = Path(f"{config['paths']['manifests']}batch_jobs.csv")
-    if not manifest_path.exists():
-        print("[ERROR] No manifest found. Run submit_batches.py first.")
-        return
+    log_lines.append(f"  {filename}: {batch.status}")
     
-    manifest_df = pd.read_csv(manifest_path)
+    # Update status (only changed cells are recorded)
+    changes = {}
+    if batch.status != status:
+        changes['status'] = batch.status
     
-    # Initialize OpenAI client
-    client = OpenAI()
+    # Download if completed
+    if batch.status == 'completed' and batch.output_file_id:
+        output_path = f"{config['paths']['responses']}{filename}"
+        if not has_response or not Path(output_path).exists():
+            log_lines.append(f"    → Downloading results for {filename}...")
+            
+            async with semaphore:
+                downloaded = await download_batch_output(client, batch.output_file_id, output_path)
+            
+            if downloaded:
+                changes.update({
+                    'completed_at': datetime.now().isoformat(),
+                    'output_file_id': batch.output_file_id,
+                    'response_file': filename
+                })
+                log_lines.append(f"    ✓ Downloaded to {output_path}")
     
-    # Track poll cycles for progress summary (every 2 cycles = 10 mins)
-    poll_cycle = 0
+    elif batch.status == 'failed':
+        log_lines.append(f"    ✗ {filename}: Batch failed!")
     
-    while True:
-        poll_cycle += 1
-        print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Checking batch statuses...")
+    return changes
+
+
+async def poll(args, config, manifest_df):
+    """
+    Poll until every batch is finished (or once with --once).
+    Status checks and downloads for all batches run concurrently on one event loop.
+    """
+    # Uses OPENAI_API_KEY from environment
+    async with create_async_client() as client:
+        semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+        
+        # Track poll cycles for progress summary (every 2 cycles = 10 mins)
+        poll_cycle = 0
         
-        updated = False
+        # Records appended to the manifest update log since the last snapshot
+        log_records = 0
         
-        for idx, row in manifest_df.iterrows():
-            batch_id = row['batch_id']
-            status = row['status']
-            filename = row['filename']
+        while True:
+            poll_cycle += 1
+            print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Checking batch statuses...")
             
-            # Skip if already completed
-            if status == 'completed' and pd.notna(row['response_file']):
-                continue
+            # Batches that still need a status check or a download
+            # (null checks done once per column, not per row)
+            batch_ids = manifest_df['batch_id'].to_numpy()
+            statuses = manifest_df['status'].to_numpy()
+            filenames = manifest_df['filename'].to_numpy()
+            has_resp = manifest_df['response_file'].notna().to_numpy()
+            todo = ~((manifest_df['status'] == 'completed').to_numpy() & has_resp)
+            to_check = list(zip(batch_ids[todo], statuses[todo], filenames[todo], has_resp[todo]))
             
-            # Check status
-            batch = check_batch_status(client, batch_id)
+            # One paginated listing refreshes most statuses in a few requests
+            listed = await list_batches(client, [row[0] for row in to_check])
             
-            if not batch:
-                continue
+            # Per-batch status lines, written in one go after the cycle
+            log_lines = []
+            changes = await asyncio.gather(*(
+                poll_batch(client, semaphore, config, listed, log_lines, *row) for row in to_check
+            ))
+            if log_lines:
+                sys.stdout.write('\n'.join(log_lines) + '\n')
+                sys.stdout.flush()
             
-            print(f"  {filename}: {batch.status}")
+            # Collected as {batch_id: {column: value}} and applied once
+            status_updates = {row[0]: change for row, change in zip(to_check, changes) if change}
+            manifest_df = apply_manifest_updates(manifest_df, status_updates)
             
-            # Update status
-            manifest_df.at[idx, 'status'] = batch.status
+            # Log this cycle's changes; compact into a new snapshot once the log
+            # holds more records than the manifest has rows
+            if status_updates:
+                log_records += append_manifest_updates(status_updates, config)
+                
+                if log_records > len(manifest_df):
+                    save_manifest(manifest_df, config)
+                    log_records = 0
+                
+                print(f"\n[INFO] Updated manifest")
             
-            # Download if completed
-            if batch.status == 'completed' and batch.output_file_id:
-                output_path = f"{config['paths']['responses']}{filename}"
-                if pd.isna(row['response_file']) or not Path(output_path).exists():
-                    print(f"    → Downloading results...")
-                    
-                    if download_batch_output(client, batch.output_file_id, output_path):
-                        manifest_df.at[idx, 'completed_at'] = datetime.now().isoformat()
-                        manifest_df.at[idx, 'output_file_id'] = batch.output_file_id
-                        manifest_df.at[idx, 'response_file'] = filename
-                        print(f"    ✓ Downloaded to {output_path}")
-                        updated = True
+            # Show detailed progress summary every 2 cycles (10 minutes); the
+            # file parsing runs off the event loop
+            if poll_cycle % 2 == 0:
+                stats = await asyncio.to_thread(
+                    analyze_progress, config, manifest_df, batch_size=config['batch']['batch_size']
+                )
+                print_progress_summary(stats)
             
-            elif batch.status == 'failed':
-                print(f"    ✗ Batch failed!")
-                manifest_df.at[idx, 'status'] = 'failed'
-                updated = True
-        
-        # Save manifest if updated
-        if updated:
-            manifest_df.to_csv(manifest_path, index=False)
-            print(f"\n[INFO] Updated manifest")
-        
-        # Show detailed progress summary every 2 cycles (10 minutes)
-        if poll_cycle % 2 == 0:
-            stats = analyze_progress(config, manifest_df, batch_size=config['batch']['batch_size'])
-            print_progress_summary(stats)
-        
-        # Check if all complete
-        pending = manifest_df[~manifest_df['status'].isin(['completed', 'failed', 'cancelled'])]
-        
-        if pending.empty:
-            print(f"\n{'='*80}")
-            print("ALL BATCHES COMPLETED!")
-            print(f"{'='*80}")
+            # Check if all complete
+            pending = manifest_df[~manifest_df['status'].isin(['completed', 'failed', 'cancelled'])]
             
-            completed = len(manifest_df[manifest_df['status'] == 'completed'])
-            failed = len(manifest_df[manifest_df['status'] == 'failed'])
+            if pending.empty:
+                # Final compaction so the snapshot alone reflects the finished run
+                if log_records:
+                    save_manifest(manifest_df, config)
+                
+                print(f"\n{'='*80}")
+                print("ALL BATCHES COMPLETED!")
+                print(f"{'='*80}")
+                
+                completed = len(manifest_df[manifest_df['status'] == 'completed'])
+                failed = len(manifest_df[manifest_df['status'] == 'failed'])
+                
+                print(f"Completed: {completed}")
+                print(f"Failed: {failed}")
+                print(f"\nNext: Run merge_responses.py to consolidate results")
+                break
             
-            print(f"Completed: {completed}")
-            print(f"Failed: {failed}")
-            print(f"\nNext: Run merge_responses.py to consolidate results")
-            break
-        
-        # Exit if --once flag
-        if args.once:
-            print(f"\nPending batches: {len(pending)}")
-            break
-        
-        # Wait before next poll
-        print(f"\n[INFO] {len(pending)} batches still pending. Waiting {args.interval}s...")
-        time.sleep(args.interval)
+            # Exit if --once flag
+            if args.once:
+                print(f"\nPending batches: {len(pending)}")
+                break
+            
+            # Wait before next poll
+            print(f"\n[INFO] {len(pending)} batches still pending. Waiting {args.interval}s...")
+            await asyncio.sleep(args.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll batch status and download results")
+    parser.add_argument('--interval', type=int, default=300, help='Polling interval in seconds')
+    parser.add_argument('--once', action='store_true', help='Check once and exit (no loop)')
+    
+    args = parser.parse_args()
+    config = load_config()
+    
+    print("="*80)
+    print("POLL BATCHES")
+    print("="*80)
+    
+    # Load manifest
+    manifest_df = load_manifest(config)
+    if manifest_df is None:
+        print("[ERROR] No manifest found. Run submit_batches.py first.")
+        return
+    
+    asyncio.run(poll(args, config, manifest_df))
 
 
 if __name__ == "__main__":
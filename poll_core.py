@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Shared OpenAI Batch API helpers for submit_batches.py and poll_batches.py:
+config loading, API clients, status/download calls and the batch job manifest.
+"""
+
+import asyncio
+from functools import cache
+from pathlib import Path
+
+import httpx
+import msgspec
+import pandas as pd
+import yaml
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+# Batches returned per batches.list page (API maximum)
+BATCH_LIST_PAGE_SIZE = 100
+
+# Shared by the sync (submit) and async (poll) clients
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=5.0)  # SDK defaults
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=64)
+
+
+@cache
+def load_config():
+    """Parsed config.yaml; read once per process."""
+    with open("config.yaml") as f:
+        return yaml.safe_load(f)
+
+
+def create_client():
+    """
+    OpenAI client on a pooled HTTP/2 connection, so parallel requests
+    multiplex over a few TLS connections instead of one each.
+    """
+    http_client = DefaultHttpxClient(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return OpenAI(http_client=http_client)
+
+
+def create_async_client():
+    """Async counterpart of create_client, used by the polling loop."""
+    http_client = DefaultAsyncHttpxClient(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return AsyncOpenAI(http_client=http_client)
+
+
+async def check_batch_status(client, batch_id):
+    """
+    Check status of a batch.
+    
+    Returns batch object.
+    """
+    try:
+        batch = await client.batches.retrieve(batch_id)
+        return batch
+    except Exception as e:
+        print(f"[ERROR] Failed to check batch {batch_id}: {e}")
+        return None
+
+
+async def list_batches(client, batch_ids):
+    """
+    Fetch batch objects for batch_ids via the paginated list endpoint
+    (up to BATCH_LIST_PAGE_SIZE per request instead of one retrieve each).
+    
+    Stops paging once every id has been seen. Returns {batch_id: batch};
+    ids that could not be listed are simply absent.
+    """
+    wanted = set(batch_ids)
+    found = {}
+    if not wanted:
+        return found
+    
+    try:
+        async for batch in client.batches.list(limit=BATCH_LIST_PAGE_SIZE):
+            if batch.id in wanted:
+                found[batch.id] = batch
+                if len(found) == len(wanted):
+                    break
+    except Exception as e:
+        print(f"[WARNING] Failed to list batches: {e}")
+    
+    return found
+
+
+async def download_batch_output(client, output_file_id, output_path):
+    """
+    Download batch output file.
+    Streams to a .part file in 1 MiB chunks (never holding the whole output in
+    memory) and renames it into place once complete. Disk writes run in a
+    worker thread so they don't stall the event loop.
+    """
+    try:
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        part_path = output_path.with_name(output_path.name + '.part')
+        
+        async with client.files.with_streaming_response.content(output_file_id) as response:
+            with open(part_path, 'wb') as f:
+                async for chunk in response.iter_bytes(chunk_size=1 << 20):
+                    await asyncio.to_thread(f.write, chunk)
+        
+        part_path.replace(output_path)
+        
+        return True
+    except Exception as e:
+        print(f"[ERROR] Failed to download output: {e}")
+        return False
+
+
+def load_manifest(config):
+    """
+    Load the batch job manifest: the Parquet snapshot plus any changes recorded
+    in the update log since it was written.
+    A legacy batch_jobs.csv is imported once, with its NaN cells turned into None.
+    
+    Returns DataFrame, or None if no manifest exists yet.
+    """
+    manifests_dir = Path(config['paths']['manifests'])
+    
+    parquet_path = manifests_dir / 'batch_jobs.parquet'
+    csv_path = manifests_dir / 'batch_jobs.csv'
+    
+    if parquet_path.exists():
+        manifest_df = pd.read_parquet(parquet_path)
+    elif csv_path.exists():
+        print(f"[INFO] Importing legacy manifest {csv_path}")
+        manifest_df = pd.read_csv(csv_path)
+        manifest_df = manifest_df.astype(object).where(manifest_df.notna(), None)
+    else:
+        return None
+    
+    # Replay the update log (later records win)
+    log_path = manifest_log_path(config)
+    if log_path.exists():
+        updates = {}
+        with open(log_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = msgspec.json.decode(line)
+                except msgspec.DecodeError:
+                    # Torn last line from an interrupted run
+                    continue
+                updates.setdefault(record['batch_id'], {})[record['col']] = record['val']
+        
+        manifest_df = apply_manifest_updates(manifest_df, updates)
+    
+    return manifest_df
+
+
+def manifest_log_path(config):
+    """Append-only log of manifest changes made since the last snapshot."""
+    return Path(config['paths']['manifests']) / 'batch_jobs_updates.jsonl'
+
+
+def append_manifest_updates(updates, config):
+    """
+    Append {batch_id: {column: value}} updates to the manifest update log,
+    one record per changed cell. The Parquet snapshot is not rewritten.
+    
+    Returns number of records written.
+    """
+    records = [
+        msgspec.json.encode({'batch_id': batch_id, 'col': col, 'val': val})
+        for batch_id, changes in updates.items()
+        for col, val in changes.items()
+    ]
+    
+    if not records:
+        return 0
+    
+    log_path = manifest_log_path(config)
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'ab') as f:
+        f.write(b'\n'.join(records) + b'\n')
+    
+    return len(records)
+
+
+def save_manifest(manifest_df, config):
+    """
+    Write a full Parquet snapshot of the manifest and clear the update log
+    (compaction). Returns the path written.
+    """
+    manifest_path = Path(config['paths']['manifests']) / 'batch_jobs.parquet'
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    manifest_df.to_parquet(manifest_path, engine='pyarrow', compression='zstd', index=False)
+    
+    # Snapshot is durable before the log goes; replaying a stale log would be harmless
+    manifest_log_path(config).unlink(missing_ok=True)
+    
+    return manifest_path
+
+
+def apply_manifest_updates(manifest_df, updates):
+    """
+    Apply {batch_id: {column: value}} updates to the manifest in one pass.
+    Returns the updated manifest with its original column order.
+    """
+    if not updates:
+        return manifest_df
+    
+    upd = pd.DataFrame.from_dict(updates, orient='index')
+    
+    # Updated columns must accept string values even if they are all-null so far
+    indexed = manifest_df.set_index('batch_id').astype({col: object for col in upd.columns})
+    indexed.update(upd)
+    
+    return indexed.reset_index()[manifest_df.columns]
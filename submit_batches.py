@@ -5,18 +5,18 @@ Records batch IDs and metadata in manifest.
 """
 
 import gzip
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
 import pandas as pd
-import yaml
-from openai import OpenAI
 from tqdm import tqdm
 
+from poll_core import create_client, load_config, load_manifest, save_manifest
 
-def load_config():
-    with open("config.yaml") as f:
-        return yaml.safe_load(f)
+# Concurrent uploads, kept modest to stay inside OpenAI's file upload rate limit
+SUBMIT_WORKERS = 8
 
 
 def submit_batch_file(client, filepath, config):
@@ -26,10 +26,10 @@ def submit_batch_file(client, filepath, config):
     Returns batch object with id, status, etc.
     """
     try:
-        # Upload file
+        # Upload file (httpx streams the open handle in chunks; no full in-memory copy)
         with open(filepath, 'rb') as f:
             batch_input_file = client.files.create(
-                file=f,
+                file=(filepath.name, f, 'application/jsonl'),
                 purpose="batch"
             )
         
@@ -65,7 +65,7 @@ def main():
     print("="*80)
     
     # Initialize OpenAI client
-    client = OpenAI()  # Uses OPENAI_API_KEY from environment
+    client = create_client()  # Uses OPENAI_API_KEY from environment
     
     # Find all batch request files
     requests_dir = Path(config['paths']['requests'])
@@ -79,42 +79,49 @@ def main():
     print(f"[INFO] Found {len(batch_files)} batch files to submit")
     
     # Load existing manifest if any
-    manifest_path = Path(f"{config['paths']['manifests']}batch_jobs.csv")
-    if manifest_path.exists():
-        manifest_df = pd.read_csv(manifest_path)
+    manifest_df = load_manifest(config)
+    if manifest_df is not None:
         submitted_files = set(manifest_df['filename'].values)
     else:
         manifest_df = pd.DataFrame()
         submitted_files = set()
     
-    # Submit each batch
+    # Skip files already submitted
+    todo_files = []
+    for filepath in batch_files:
+        if filepath.name in submitted_files:
+            print(f"[SKIP] {filepath.name} already submitted")
+        else:
+            todo_files.append(filepath)
+    
+    # Submit in parallel (each upload + create is a slow HTTPS round-trip)
     new_batches = []
     
-    for filepath in tqdm(batch_files):
-        filename = filepath.name
-        
-        # Skip if already submitted
-        if filename in submitted_files:
-            print(f"[SKIP] {filename} already submitted")
-            continue
-        
-        print(f"[SUBMIT] {filename}...")
-        result = submit_batch_file(client, filepath, config)
+    if todo_files:
+        print(f"[SUBMIT] {len(todo_files)} files with {SUBMIT_WORKERS} workers...")
+    
+    with ThreadPoolExecutor(max_workers=SUBMIT_WORKERS) as executor:
+        results = executor.map(lambda filepath: submit_batch_file(client, filepath, config), todo_files)
+        progress = tqdm(zip(todo_files, results), total=len(todo_files),
+                        disable=not sys.stderr.isatty(), mininterval=0.5)
         
-        if result:
-            new_batches.append({
-                'filename': filename,
-                'batch_id': result['batch_id'],
-                'input_file_id': result['input_file_id'],
-                'status': result['status'],
-                'submitted_at': result['created_at'],
-                'completed_at': None,
-                'output_file_id': None,
-                'response_file': None
-            })
-            print(f"  ✓ Batch ID: {result['batch_id']}")
-        else:
-            print(f"  ✗ Failed")
+        for filepath, result in progress:
+            filename = filepath.name
+            
+            if result:
+                new_batches.append({
+                    'filename': filename,
+                    'batch_id': result['batch_id'],
+                    'input_file_id': result['input_file_id'],
+                    'status': result['status'],
+                    'submitted_at': result['created_at'],
+                    'completed_at': None,
+                    'output_file_id': None,
+                    'response_file': None
+                })
+                print(f"  ✓ {filename}: Batch ID {result['batch_id']}")
+            else:
+                print(f"  ✗ {filename}: Failed")
     
     if not new_batches:
         print("[INFO] No new batches submitted")
@@ -128,8 +135,7 @@ def main():
     else:
         manifest_df = new_df
     
-    manifest_path.parent.mkdir(parents=True, exist_ok=True)
-    manifest_df.to_csv(manifest_path, index=False)
+    manifest_path = save_manifest(manifest_df, config)
     
     # Summary
     print(f"\n{'='*80}")
@@ -5,7 +5,9 @@ Validate and analyze output tables.
 
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 
 
 def validate_business_intelligence():
@@ -16,7 +18,16 @@ def validate_business_intelligence():
         print("[ERROR] business_intelligence.csv not found")
         return
     
-    df = pd.read_csv(path)
+    fields = ['sectorial_niches', 'end_markets', 'product_offerings', 'service_offerings', 'core_activities']
+    
+    # Arrow-backed columns: string checks below run as vectorized Arrow kernels.
+    # Field columns are forced to string so an all-empty column isn't typed as null.
+    df = pd.read_csv(
+        path,
+        engine='pyarrow',
+        dtype_backend='pyarrow',
+        dtype={field: pd.ArrowDtype(pa.string()) for field in fields}
+    )
     
     print("="*80)
     print("BUSINESS INTELLIGENCE VALIDATION")
@@ -41,11 +52,11 @@ def validate_business_intelligence():
     success = df[df['scrape_status'] == 'success']
     
     if not success.empty:
-        fields = ['sectorial_niches', 'end_markets', 'product_offerings', 'service_offerings', 'core_activities']
-        for field in fields:
-            non_empty = success[field].str.strip().str.len() > 0
-            pct = non_empty.sum() / len(success) * 100
-            print(f"  {field}: {non_empty.sum()}/{len(success)} ({pct:.1f}%)")
+        # Empty cells are read as null, which the comparison leaves out of the count
+        non_empty = success[fields].apply(lambda col: col.str.strip().str.len().gt(0).sum())
+        for field, count in non_empty.items():
+            pct = count / len(success) * 100
+            print(f"  {field}: {count}/{len(success)} ({pct:.1f}%)")
     
     # Sample rows
     print(f"\nSample successful extractions (first 5):")
@@ -65,7 +76,9 @@ def validate_quality_status():
         print("\n[ERROR] website_quality_status.csv not found")
         return
     
-    df = pd.read_csv(path)
+    # Only the status column is used; as a category, counts and the success
+    # mask work on small integer codes instead of hashing strings
+    df = pd.read_csv(path, usecols=['scrape_status'], dtype={'scrape_status': 'category'})
     
     print("\n" + "="*80)
     print("QUALITY STATUS VALIDATION")
@@ -77,7 +90,7 @@ def validate_quality_status():
     print(f"\nStatus distribution:")
     print(df['scrape_status'].value_counts())
     
-    success_rate = len(df[df['scrape_status'] == 'success']) / len(df) * 100
+    success_rate = (df['scrape_status'] == 'success').mean() * 100
     print(f"\nSuccess rate: {success_rate:.1f}%")
 
 
@@ -94,8 +107,9 @@ def check_data_integrity():
         print("[ERROR] Missing required tables")
         return
     
-    bi_df = pd.read_csv(bi_path)
-    qs_df = pd.read_csv(qs_path)
+    # Only custom_id is checked here
+    bi_df = pd.read_csv(bi_path, usecols=['custom_id'])
+    qs_df = pd.read_csv(qs_path, usecols=['custom_id'])
     
     # Check row counts match
     if len(bi_df) == len(qs_df):
@@ -103,27 +117,26 @@ def check_data_integrity():
     else:
         print(f"✗ Row count mismatch: BI={len(bi_df)}, QS={len(qs_df)}")
     
-    # Check custom_ids match
-    bi_ids = set(bi_df['custom_id'])
-    qs_ids = set(qs_df['custom_id'])
+    # Check custom_ids match (sorted unique arrays of fixed-width strings, not Python sets)
+    bi_ids = np.unique(bi_df['custom_id'].to_numpy(dtype=str))
+    qs_ids = np.unique(qs_df['custom_id'].to_numpy(dtype=str))
     
-    if bi_ids == qs_ids:
+    if np.array_equal(bi_ids, qs_ids):
         print(f"✓ Custom IDs match")
     else:
-        missing = bi_ids - qs_ids
-        extra = qs_ids - bi_ids
-        if missing:
-            print(f"✗ {len(missing)} IDs in BI but not QS")
-        if extra:
-            print(f"✗ {len(extra)} IDs in QS but not BI")
-    
-    # Check for duplicates
-    bi_dupes = bi_df['custom_id'].duplicated().sum()
-    qs_dupes = qs_df['custom_id'].duplicated().sum()
-    
-    if bi_dupes == 0 and qs_dupes == 0:
+        missing = np.setdiff1d(bi_ids, qs_ids, assume_unique=True)
+        extra = np.setdiff1d(qs_ids, bi_ids, assume_unique=True)
+        if missing.size:
+            print(f"✗ {missing.size} IDs in BI but not QS")
+        if extra.size:
+            print(f"✗ {extra.size} IDs in QS but not BI")
+    
+    # Check for duplicates (any() short-circuits; counts only needed on failure)
+    if not bi_df['custom_id'].duplicated().any() and not qs_df['custom_id'].duplicated().any():
         print(f"✓ No duplicate custom_ids")
     else:
+        bi_dupes = bi_df['custom_id'].duplicated().sum()
+        qs_dupes = qs_df['custom_id'].duplicated().sum()
         print(f"✗ Duplicates found: BI={bi_dupes}, QS={qs_dupes}")
 
 